@@ -31,10 +31,15 @@ then choose a subset of the symbols to be considered independent. The class then
 provides functions that map the independents to the dependents.
 """
 import functools
+import importlib
 import inspect
+import itertools
+import operator
+import types
 from typing import (
     Any,
     Callable,
+    Dict,
     FrozenSet,
     Iterable,
     Mapping,
@@ -42,14 +47,29 @@ from typing import (
     overload,
     Sequence,
     Set,
+    Tuple,
     Type,
     Union,
 )
 
+import numpy as np
 import sympy
 from sympy import Expr, Symbol, symbols
 
 
+@functools.lru_cache(maxsize=None)
+def _optional_import(name: str) -> Optional[types.ModuleType]:
+    """Import an optional dependency, or get None if it isn't installed.
+
+    numba, scipy and symengine are slow to import, so they're only imported
+    the first time they're needed rather than with this module.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
 class NoSolution(Exception):
     """Raised when a system has no solution."""
 
@@ -93,35 +113,51 @@ class System:
         independents: The set of symbols considered independent.
         solutions: Maps symbols to expressions giving that symbol in terms of
             other symbols which have been explicitly constrained.
+        numeric_symbols: Symbols that sympy couldn't solve for in closed form,
+            which evaluate finds by root finding instead.
     """
 
     constraints: FrozenSet[Expr]
     symbols: FrozenSet[Symbol]
     independents: FrozenSet[Symbol]
     solutions: Mapping[Symbol, Expr]
+    numeric_symbols: FrozenSet[Symbol]
 
     def __init__(
         self,
         constraints: Iterable[Expr],
         independents: Optional[FrozenSet[Symbol]] = None,
         solutions: Optional[Mapping[Symbol, Expr]] = None,
+        numeric_symbols: Optional[FrozenSet[Symbol]] = None,
     ):
-        self.constraints = frozenset(constraint for constraint in constraints)
+        self.constraints = frozenset(constraints)
 
-        self.symbols = frozenset(
-            symbol for constraint in self.constraints for symbol in constraint.free_symbols
-        )
+        self.symbols = _symbols_of(self.constraints)
+        self._symbols_by_constraint = _symbols_by_constraint(self.constraints)
+        self._constraints_by_symbol = _constraints_by_symbol(self.constraints)
 
         if independents is None:
             self.independents = frozenset()
         else:
             self.independents = independents
+        self._sorted_independents = tuple(
+            sorted(self.independents, key=operator.attrgetter('name'))
+        )
 
         if solutions is None:
             self.solutions = {}
         else:
             self.solutions = solutions
 
+        if numeric_symbols is None:
+            self.numeric_symbols = frozenset()
+        else:
+            self.numeric_symbols = numeric_symbols
+
+        # Built by evaluate on first use.
+        self._evaluator: Optional[Tuple[Tuple[Symbol, ...], Callable]] = None
+        self._residual: Optional[Tuple[Tuple[Symbol, ...], Callable, Callable]] = None
+
     def evaluate(self, values: Mapping[Symbol, float]) -> Mapping[Symbol, float]:
         """Numerically evaluate symbols given values for explicitly set ones.
 
@@ -130,28 +166,240 @@ class System:
 
         Returns: Mapping from symbol name to numeric values. Includes all
             symbols.
+
+        Symbols that sympy couldn't solve for in closed form are found by
+        numerical root finding, which needs scipy.
+        """
+        unsolved = self.symbols - self.solutions.keys()
+        if unsolved and not self._numerically_solvable(unsolved):
+            raise ValueError("System not yet fully constrained")
+        if unsolved and _optional_import('scipy.optimize') is None:
+            raise ImportError("scipy is required to find symbols without closed form solutions")
+        if not frozenset(values.keys()) == self.independents:
+            raise ValueError("Values must match explicitly set symbols")
+
+        if self._evaluator is None:
+            # Evaluate all solutions with one function so that subexpressions
+            # shared between solutions are only computed once.
+            symbols = tuple(self.solutions.keys())
+            expressions = tuple(self.solutions[symbol] for symbol in symbols)
+            self._evaluator = (symbols, _compile_solutions(expressions, self._sorted_independents))
+        symbols, function = self._evaluator
+        try:
+            # Plain numpy floats follow numpy's rules, e.g. dividing by zero
+            # gives inf rather than raising ZeroDivisionError.
+            args = [np.float64(values[symbol]) for symbol in self._sorted_independents]
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                results = dict(zip(symbols, function(*args)))
+        except (NameError, TypeError, OverflowError):
+            # lambdify leaves functions numpy doesn't have, e.g. LambertW,
+            # undefined in the generated code, and values that aren't real
+            # floats, e.g. complex or huge ints, can't be converted.
+            results = dict.fromkeys(symbols, np.nan)
+        # numpy only works with real floats, so complex solutions, e.g. the
+        # square root of a negative value, come out as nan. sympy gets those
+        # and the functions numpy doesn't have right, just more slowly.
+        for symbol, result in results.items():
+            if np.isnan(result):
+                results[symbol] = _as_number(self.solutions[symbol].xreplace(values))
+        if unsolved:
+            results.update(self._numeric_solve(values))
+        return results
+
+    def evaluate_batch(self, values: Mapping[Symbol, Any]) -> Mapping[Symbol, np.ndarray]:
+        """Numerically evaluate symbols for arrays of values of explicitly set ones.
+
+        This is like evaluate, but computes every solution for all the values
+        in one vectorized call rather than in a Python loop.
+
+        values: Mapping from symbol to an array of its numeric values. Must
+            contain exactly the symbols that were explicitly constrained on this
+            instance. The arrays are broadcast against each other.
+
+        Returns: Mapping from symbol to an array of numeric values with the
+            broadcast shape of the inputs. Includes all symbols.
+
+        Like evaluate, values numpy can't compute, e.g. complex ones or ones
+        using functions numpy doesn't have, are computed with sympy instead.
+        That happens one value at a time, so it's much slower. An array with
+        any complex values is complex.
         """
-        if not len(self.solutions) == len(self.symbols):
+        # Root finding happens one point at a time, so there's nothing to
+        # vectorize without closed form solutions.
+        if self.symbols - self.solutions.keys():
             raise ValueError("System not yet fully constrained")
         if not frozenset(values.keys()) == self.independents:
             raise ValueError("Values must match explicitly set symbols")
 
+        symbols = tuple(self.solutions.keys())
+        expressions = tuple(self.solutions[symbol] for symbol in symbols)
+        function = _lambdify_cached(expressions, self._sorted_independents, cse=True)
+        arrays = [np.asarray(values[symbol]) for symbol in self._sorted_independents]
+        shape = np.broadcast_shapes(*(array.shape for array in arrays))
+
+        try:
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                outputs = function(*arrays)
+        except NameError:
+            # As in evaluate, functions numpy doesn't have are left undefined.
+            outputs = [np.nan] * len(symbols)
+
         results = {}
-        for (symbol, expression) in self.solutions.items():
-            substitutions = [(symb, values[symb]) for symb in self.independents]
-            results[symbol] = sympy.N(expression.subs(substitutions))
+        for symbol, result in zip(symbols, outputs):
+            # Solutions that are constant or depend on only some of the values
+            # come out smaller than the full shape, and the independents come
+            # out as the caller's own arrays, so always copy.
+            result = np.broadcast_to(result, shape).copy()
+            missing = np.isnan(result)
+            if missing.any():
+                result = self._evaluate_missing(symbol, result, missing, arrays)
+            results[symbol] = result
         return results
 
+    def _evaluate_missing(
+        self,
+        symbol: Symbol,
+        result: np.ndarray,
+        missing: np.ndarray,
+        arrays: Sequence[np.ndarray],
+    ) -> np.ndarray:
+        """Fill in the values of a symbol that numpy couldn't compute with sympy.
+
+        Args:
+            symbol: The symbol whose values are in result.
+            result: Values of the symbol, with nan where numpy failed.
+            missing: Boolean mask of the values to compute.
+            arrays: Values of the independents, in sorted order.
+
+        Returns: The result, with the missing values filled in. This is a new
+            complex array if any of them are complex.
+        """
+        broadcast = np.broadcast_arrays(*arrays)
+        numbers = []
+        for index in map(tuple, np.argwhere(missing)):
+            point = {
+                independent: array[index]
+                for independent, array in zip(self._sorted_independents, broadcast)
+            }
+            numbers.append(_as_number(self.solutions[symbol].xreplace(point)))
+        result = result.astype(np.result_type(result, *numbers), copy=False)
+        result[missing] = numbers
+        return result
+
+    def _unsolved_constraints(self, unsolved: FrozenSet[Symbol]) -> FrozenSet[Expr]:
+        """Get the constraints involving symbols without closed form solutions."""
+        return frozenset(
+            constraint
+            for constraint, constraint_symbols in self._symbols_by_constraint.items()
+            if not constraint_symbols.isdisjoint(unsolved)
+        )
+
+    def _numerically_solvable(self, unsolved: FrozenSet[Symbol]) -> bool:
+        """Check whether _numeric_solve can find the unsolved symbols.
+
+        Every unsolved symbol must be one sympy failed to solve for in closed
+        form, with exactly as many constraints as unknowns. Otherwise the
+        system really isn't fully constrained yet.
+        """
+        constraints = self._unsolved_constraints(unsolved)
+        return unsolved <= self.numeric_symbols and len(constraints) == len(unsolved)
+
+    def _numeric_solve(self, values: Mapping[Symbol, float]) -> Mapping[Symbol, float]:
+        """Find symbols without closed form solutions by root finding.
+
+        Args:
+            values: Mapping from independent symbol to its numeric value.
+
+        Returns: Mapping from each unsolved symbol to its numeric value.
+
+        Raises:
+            NoSolution: The root finder didn't converge.
+            ValueError: The constraints are singular at the root, so they
+                don't determine the unsolved symbols.
+        """
+        if self._residual is None:
+            unknowns = tuple(
+                sorted(self.symbols - self.solutions.keys(), key=operator.attrgetter('name'))
+            )
+            # Write the constraints in terms of the unknowns and independents
+            # only, and compile them into a single vector-valued function.
+            residuals = [
+                constraint.xreplace(self.solutions)
+                for constraint in self._unsolved_constraints(frozenset(unknowns))
+            ]
+            args = [unknowns, self._sorted_independents]
+            function = sympy.lambdify(args, residuals, modules="numpy", cse=True)
+            jacobian = sympy.lambdify(
+                args, sympy.Matrix(residuals).jacobian(unknowns), modules="numpy", cse=True
+            )
+            self._residual = (unknowns, function, jacobian)
+        unknowns, function, jacobian = self._residual
+
+        args = tuple(values[symbol] for symbol in self._sorted_independents)
+        solution, info, status, _ = _optional_import('scipy.optimize').fsolve(
+            function, np.ones(len(unknowns)), args=(args,), fprime=jacobian, full_output=True
+        )
+        # Floats are only so precise, so how close to zero the residuals can
+        # get scales with the size of the values involved.
+        tolerance = 1e-8 * max(1.0, np.max(np.abs(solution)), *np.abs(args))
+        if status != 1 or not np.allclose(info['fvec'], 0, atol=tolerance):
+            raise NoSolution()
+        # Where the Jacobian is singular the root isn't isolated, e.g. when
+        # two constraints are really the same, so fsolve just stopped at an
+        # arbitrary point of a family of solutions.
+        if np.linalg.matrix_rank(jacobian(solution, args)) < len(unknowns):
+            raise ValueError("System not yet fully constrained")
+        return dict(zip(unknowns, solution))
+
     def with_independents(self, symbols: Iterable[Symbol]) -> 'System':
         """Get a new System with some symbols considered independent.
 
+        This is equivalent to calling with_independent for each symbol in turn,
+        but only builds one new System.
+
         Args:
             symbols: The symbols to mark as constrained.
         """
-        system = self
+        symbols = tuple(symbols)
+        if self.independents or self.solutions:
+            solutions, numeric_symbols = self._solve_independents(symbols)
+        else:
+            # Starting from scratch, the solutions only depend on the
+            # constraints and the symbols, so they're shared process-wide.
+            solution_items, numeric_symbols = _solutions_for(self.constraints, symbols)
+            solutions = dict(solution_items)
+
+        return System(
+            constraints=self.constraints,
+            independents=self.independents.union(symbols),
+            solutions=solutions,
+            numeric_symbols=numeric_symbols,
+        )
+
+    def _solve_independents(
+        self, symbols: Iterable[Symbol]
+    ) -> Tuple[Dict[Symbol, Expr], FrozenSet[Symbol]]:
+        """Get solutions once each of the symbols is marked independent, in turn.
+
+        Returns: Mapping from symbol to its solution, including the existing
+            solutions of this System, and the symbols that are left without a
+            solution because sympy couldn't find one in closed form.
+        """
+        independents = set(self.independents)
+        known_solutions = dict(self.solutions)
+        numeric_symbols = set(self.numeric_symbols)
         for symbol in symbols:
-            system = system.with_independent(symbol)
-        return system
+            if symbol in independents:
+                raise ValueError(f"Symbol {symbol} already explicitly set")
+            if symbol in known_solutions:
+                raise ValueError(f"Symbol {symbol} already solved via {known_solutions[symbol]}")
+            # If nothing has been solved yet, any constraint might be solvable
+            # (e.g. x - 3 = 0), not just those involving the new symbol.
+            frontier = {symbol} if known_solutions else self.symbols
+            independents.add(symbol)
+            known_solutions[symbol] = symbol
+            self._propagate(frontier, known_solutions, numeric_symbols)
+        return known_solutions, frozenset(numeric_symbols - known_solutions.keys())
 
     def with_independent(self, symbol: Symbol) -> 'System':
         """Get a new System with a symbol constrained.
@@ -163,63 +411,329 @@ class System:
         Returns a new System with the additional constrained symbol, and
             possible more solutions.
         """
-        if symbol in self.independents:
-            raise ValueError(f"Symbol {symbol} already explicitly set")
-        if symbol in self.solutions:
-            raise ValueError(f"Symbol {symbol} already solved via {self.solutions[symbol]}")
-        known_solutions = {symbol: symbol}
-        known_solutions.update(self.solutions)
-
-        while True:
-            new_solutions = self._check_for_solutions(known_solutions)
-            if not new_solutions:
+        return self.with_independents([symbol])
+
+    def _propagate(
+        self,
+        frontier: Iterable[Symbol],
+        known_solutions: Dict[Symbol, Expr],
+        numeric_symbols: Set[Symbol],
+    ):
+        """Add everything that can be solved for now that frontier is known.
+
+        Args:
+            frontier: Symbols that just became known.
+            known_solutions: Map from known symbols to their solutions. New
+                solutions are added to this in place.
+            numeric_symbols: Symbols that sympy couldn't solve for in closed
+                form. New ones are added to this in place.
+        """
+        # Only constraints that involve a newly known symbol can produce new
+        # solutions, so each pass re-solves just those.
+        while frontier:
+            constraints = self._constraints_affected_by(frontier, known_solutions)
+            # Nothing left with unknowns in it, e.g. the system is fully solved.
+            if not constraints:
                 break
+            new_solutions = self._check_for_solutions(
+                constraints, known_solutions, numeric_symbols
+            )
             for _symbol, expression in new_solutions.items():
                 known_solutions[_symbol] = expression
+            frontier = new_solutions.keys()
 
-        return System(
-            constraints=self.constraints,
-            independents=self.independents.union({symbol}),
-            solutions=known_solutions,
-        )
+    def _constraints_affected_by(
+        self, symbols: Iterable[Symbol], known_solutions
+    ) -> FrozenSet[Expr]:
+        """Get the constraints that might be solvable once symbols are known.
 
-    def _check_for_solutions(self, known_solutions) -> Mapping[Symbol, Expr]:
-        # If we have as many known solutions as we do symbols, then we're done
-        # and there are no new solutions.
-        if len(self.symbols - set(known_solutions.keys())) == 0:
+        These are the constraints that involve any of the symbols, plus every
+        constraint linked to those through a chain of shared unknown symbols,
+        since those have to be solved together. Constraints with no unknowns
+        left are skipped.
+        """
+        affected = set()
+        pending = list(symbols)
+        visited = set(pending)
+        while pending:
+            for constraint in self._constraints_by_symbol.get(pending.pop(), ()):
+                if constraint in affected:
+                    continue
+                unknowns = [
+                    s for s in self._symbols_by_constraint[constraint] if s not in known_solutions
+                ]
+                if not unknowns:
+                    continue
+                affected.add(constraint)
+                for unknown in unknowns:
+                    if unknown not in visited:
+                        visited.add(unknown)
+                        pending.append(unknown)
+        return frozenset(affected)
+
+    def _check_for_solutions(
+        self, constraints: FrozenSet[Expr], known_solutions, numeric_symbols: Set[Symbol]
+    ) -> Mapping[Symbol, Expr]:
+        # Write the constraints in terms of independents before solving.
+        # Treating an already solved symbol as a free parameter would make
+        # constraints that were used to solve for it look inconsistent.
+        # Solutions are in terms of independents, so one simultaneous
+        # exact-match replacement is equivalent to subs, and much faster.
+        constraints = frozenset(constraint.xreplace(known_solutions) for constraint in constraints)
+        known_symbols = _symbols_of(constraints).intersection(known_solutions)
+        expressions = _solvable_expressions(constraints, known_symbols)
+        if expressions is None:
+            # Leave the unknowns for evaluate to find numerically.
+            numeric_symbols.update(_symbols_of(constraints) - known_symbols)
             return {}
+        return dict(expressions)
 
-        # Solve equations for symbols that don't already have solutions.
-        symbols, expression_sets = sympy.solve(
-            self.constraints, set(self.symbols) - set(known_solutions.keys()), set=True
-        )
-        expressions = expression_sets.pop()
-        # Chomp chomp...
-        # sympy can find multiple solution sets for a set of equations and it
-        # returns all of them. Here we're just picking one randomly. This is
-        # more or less a bug and would be improved a bit by supporting
-        # assumptions about the symbols (i.e. to select the correct sign when
-        # we have sqrt and other functions with multivalued inverses).
-
-        solutions = {}
-        for symbol, expression in zip(symbols, expressions):
-            if not all(symbol in set(known_solutions.keys()) for symbol in expression.free_symbols):
-                continue
-            solutions[symbol] = expression.subs(known_solutions.items())
-        return solutions
-
-    def get_functions(self) -> Mapping[Symbol, Callable]:
+    def get_functions(self, jit: bool = False) -> Mapping[Symbol, Callable]:
+        """Get numeric functions computing each symbol from its free symbols.
+
+        Args:
+            jit: If True and numba is installed, compile each function to a
+                numba ufunc. This works for scalars and arrays alike and avoids
+                Python call overhead. Expressions that numba can't compile fall
+                back to the same functions as jit=False.
+
+        Returns: Mapping from symbol to a function whose positional arguments
+            are the expression's free symbols, sorted by name.
+        """
         # TODO: check that system is fully constrained
+        compile_function = _jit_cached if jit else _compile_function
         functions = {}
         for symbol, expression in self.solutions.items():
-            functions[symbol] = sympy.lambdify(
-                sorted(list(expression.free_symbols), key=lambda x: x.name),
-                expression,
-                modules="numpy",
-            )
+            functions[symbol] = compile_function(expression, _sorted_free_symbols(expression))
         return functions
 
 
+@functools.lru_cache(maxsize=None)
+def _solutions_for(
+    constraints: FrozenSet[Expr], independents: Tuple[Symbol, ...]
+) -> Tuple[Tuple[Tuple[Symbol, Expr], ...], FrozenSet[Symbol]]:
+    """Solve a fresh System of constraints for some independent symbols.
+
+    Returns: Pairs of (symbol, solution) in the order System.solutions would
+        have them, and System.numeric_symbols. The pairs are a tuple so that
+        the cached value can't be mutated by callers.
+    """
+    solutions, numeric_symbols = System(constraints)._solve_independents(independents)
+    return tuple(solutions.items()), numeric_symbols
+
+
+@functools.lru_cache(maxsize=None)
+def _symbols_of(constraints: FrozenSet[Expr]) -> FrozenSet[Symbol]:
+    """Get the set of free symbols appearing in any of the constraints."""
+    return frozenset(itertools.chain.from_iterable(_symbols_by_constraint(constraints).values()))
+
+
+@functools.lru_cache(maxsize=None)
+def _symbols_by_constraint(constraints: FrozenSet[Expr]) -> Mapping[Expr, FrozenSet[Symbol]]:
+    """Map each constraint to its free symbols.
+
+    sympy recomputes free_symbols on every access, which adds up when walking
+    the dependency graph between symbols and constraints.
+    """
+    return {constraint: frozenset(constraint.free_symbols) for constraint in constraints}
+
+
+@functools.lru_cache(maxsize=None)
+def _constraints_by_symbol(constraints: FrozenSet[Expr]) -> Mapping[Symbol, FrozenSet[Expr]]:
+    """Map each symbol to the constraints it appears in."""
+    result: Dict[Symbol, Set[Expr]] = {}
+    for constraint, constraint_symbols in _symbols_by_constraint(constraints).items():
+        for symbol in constraint_symbols:
+            result.setdefault(symbol, set()).add(constraint)
+    return {symbol: frozenset(related) for symbol, related in result.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _sorted_free_symbols(expression: Expr) -> Tuple[Symbol, ...]:
+    """Get the free symbols of an expression sorted by name."""
+    return tuple(sorted(expression.free_symbols, key=operator.attrgetter('name')))
+
+
+@functools.lru_cache(maxsize=None)
+def _solve_for(
+    constraints: FrozenSet[Expr], unknowns: FrozenSet[Symbol]
+) -> Optional[Tuple[Tuple[Symbol, Expr], ...]]:
+    """Solve constraints for a set of unknowns, caching the result.
+
+    This is a thin wrapper around `sympy.solve(..., dict=True)`, which is by far
+    the most expensive thing we do.
+
+    Returns: Pairs of (symbol, expression) from the first solution sympy finds.
+
+        If sympy can't solve the constraints in closed form, this is None and
+        the unknowns are left to be found numerically.
+
+    Raises:
+        NoSolution: sympy found no solutions.
+    """
+    try:
+        solutions = sympy.solve(constraints, unknowns, dict=True)
+    except NotImplementedError:
+        return None
+    if not solutions:
+        raise NoSolution()
+    # Chomp chomp...
+    # sympy can find multiple solution sets for a set of equations and it
+    # returns all of them. Here we're just picking the first one. This is
+    # more or less a bug and would be improved a bit by supporting
+    # assumptions about the symbols (i.e. to select the correct sign when
+    # we have sqrt and other functions with multivalued inverses).
+    return tuple(solutions[0].items())
+
+
+@functools.lru_cache(maxsize=None)
+def _solvable_expressions(
+    constraints: FrozenSet[Expr], known_symbols: FrozenSet[Symbol]
+) -> Optional[Tuple[Tuple[Symbol, Expr], ...]]:
+    """Find unknown symbols that can be expressed in terms of known ones.
+
+    Returns: Pairs of (symbol, expression) where the expression's free symbols
+        are all in known_symbols. The expressions have not yet had any known
+        solutions substituted into them. None if sympy can't solve the
+        constraints in closed form.
+    """
+    # If we have as many known solutions as we do symbols, then we're done
+    # and there are no new solutions.
+    unknowns = _symbols_of(constraints) - known_symbols
+    if len(unknowns) == 0:
+        return ()
+
+    # Solve equations for symbols that don't already have solutions.
+    closed_form = _solve_for(constraints, unknowns)
+    if closed_form is None:
+        return None
+
+    solutions = []
+    for symbol, expression in closed_form:
+        if not expression.free_symbols <= known_symbols:
+            continue
+        solutions.append((symbol, expression))
+    return tuple(solutions)
+
+
+def _as_number(expression: Expr) -> Union[float, complex]:
+    """Evaluate an expression without free symbols to a Python number.
+
+    Returns: A float, or a complex if the value has an imaginary part.
+    """
+    number = complex(expression)
+    return number.real if number.imag == 0 else number
+
+
+@functools.lru_cache(maxsize=None)
+def _lambdify_cached(
+    expression: Union[Expr, Tuple[Expr, ...]], args: Tuple[Symbol, ...], cse: bool = False
+) -> Callable:
+    """Compile an expression to a numpy function of args, caching the result.
+
+    Args:
+        expression: The expression to compile. If this is a tuple of
+            expressions, the function returns a tuple of values.
+        args: Symbols corresponding to the function's positional arguments.
+        cse: If True, eliminate common subexpressions so that they're only
+            computed once per call.
+    """
+    return sympy.lambdify(args, expression, modules="numpy", cse=cse)
+
+
+# Below this many operations, numpy lambdify is faster than symengine.
+_SYMENGINE_MIN_OPS = 100
+
+
+def _symengine_lambdify(
+    expressions: Tuple[Expr, ...], args: Tuple[Symbol, ...]
+) -> Optional[Callable]:
+    """Compile expressions with symengine if it's worthwhile.
+
+    symengine's Lambdify compiles to native code, with LLVM when symengine was
+    built with it. The compiled function takes the arguments along the last
+    axis of an array and returns the values along the last axis.
+
+    Returns: The compiled function, or None if symengine isn't installed, can't
+        handle the expressions, or wouldn't be faster than numpy lambdify.
+    """
+    # symengine's Lambdify has a few microseconds of fixed overhead per call,
+    # so it only beats numpy when there's a lot of arithmetic to do. It also
+    # doesn't support functions of zero arguments.
+    if not args or sympy.count_ops(expressions) < _SYMENGINE_MIN_OPS:
+        return None
+    symengine = _optional_import('symengine')
+    if symengine is None:
+        return None
+    try:
+        return symengine.Lambdify(
+            [symengine.sympify(arg) for arg in args],
+            [symengine.sympify(expression) for expression in expressions],
+            backend='llvm' if getattr(symengine, 'have_llvm', False) else None,
+            cse=True,
+        )
+    except (NotImplementedError, RuntimeError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_solutions(expressions: Tuple[Expr, ...], args: Tuple[Symbol, ...]) -> Callable:
+    """Compile expressions into one function of args returning all their values.
+
+    This is what evaluate calls, with scalar args, every time. Subexpressions
+    shared between the expressions are computed once per call, natively when
+    they're big enough for symengine to pay off.
+    """
+    compiled = _symengine_lambdify(expressions, args)
+    if compiled is not None:
+        return compiled
+    return _lambdify_cached(expressions, args, cse=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_function(expression: Expr, args: Tuple[Symbol, ...]) -> Callable:
+    """Compile an expression into a numpy-style function of args.
+
+    The function takes one argument per symbol in args, each a scalar or an
+    array, and broadcasts them like a numpy ufunc. symengine's compiled
+    functions take all the arguments stacked in one array instead, so when
+    symengine is worthwhile its function is wrapped to match.
+    """
+    compiled = _symengine_lambdify((expression,), args)
+    if compiled is None:
+        return _lambdify_cached(expression, args, cse=True)
+
+    def function(*values):
+        # Stack the arguments along the last axis so that they broadcast the
+        # same way they would with a numpy function.
+        stacked = np.stack(np.broadcast_arrays(*values), axis=-1)
+        return compiled(stacked)[..., 0][()]
+
+    return function
+
+
+@functools.lru_cache(maxsize=None)
+def _jit_cached(expression: Expr, args: Tuple[Symbol, ...]) -> Callable:
+    """Compile an expression to a numba ufunc of args, caching the result.
+
+    Falls back to `_compile_function` if numba isn't installed or can't compile
+    the expression.
+    """
+    # numba can't make a ufunc with no inputs, so constants aren't worth it.
+    numba = _optional_import('numba') if args else None
+    if numba is None:
+        return _compile_function(expression, args)
+    # numba compiles the math module much more reliably than numpy. CSE keeps
+    # the generated source small, which makes large expressions compile
+    # faster and more reliably.
+    function = sympy.lambdify(args, expression, modules="math", cse=True)
+    signature = numba.float64(*(numba.float64 for _ in args))
+    try:
+        return numba.vectorize([signature])(function)
+    except numba.core.errors.NumbaError:
+        return _compile_function(expression, args)
+
+
 def collect_symbols(expr: sympy.Expr) -> Set[sympy.Symbol]:
     """Collect all symbols in this expression.
 
@@ -238,6 +752,77 @@ def collect_symbols(expr: sympy.Expr) -> Set[sympy.Symbol]:
     return symbols
 
 
+def _arg_symbols(arg_types: Iterable[Tuple[str, type]]) -> Dict[str, Symbol]:
+    """Make a symbol for each argument of a wrapped function.
+
+    Args:
+        arg_types: Pairs of argument name and type, either int or float.
+    """
+    # We can't use integer=(ty is int) because eg integer=False excludes real
+    # number solutions that happen to be integers.
+    return {k: Symbol(k, integer=True) if ty is int else Symbol(k) for k, ty in arg_types}
+
+
+def _solve_arguments(
+    constraints: Tuple[Expr, ...],
+    arg_types: Tuple[Tuple[str, type], ...],
+    symbol_items: Tuple[Tuple[str, Symbol], ...],
+    assignments: Iterable[Tuple[str, type, Any]],
+) -> Mapping[str, Any]:
+    """Solve for the arguments of a wrapped function given some of them.
+
+    Args:
+        constraints: Relationships that must hold between the arguments,
+            written in terms of the symbols in symbol_items.
+        arg_types: Pairs of argument name and type, either int or float.
+        symbol_items: Pairs of name and symbol for every argument and given
+            keyword, as made once per wrapper. This is a tuple so that it can
+            be part of the cache key.
+        assignments: Triples of name, type and value for each given keyword.
+
+    Returns: Mapping from each argument name to its value.
+
+    Raises:
+        NoSolution: The given values are inconsistent with the constraints.
+    """
+    given = {k: v for k, _, v in assignments}
+    arg_symbols = dict(symbol_items)
+
+    # When every arg is given there's nothing to solve for, as long as the
+    # values satisfy the constraints exactly. Anything less clear cut, eg
+    # float round-off or a non-integral value for an int arg, is left to
+    # sympy.solve below.
+    if given.keys() == {k for k, _ in arg_types} and all(
+        ty is not int or float(given[k]).is_integer() for k, ty in arg_types
+    ):
+        substitutions = {arg_symbols[k]: v for k, v in given.items()}
+        if all(constraint.xreplace(substitutions) == 0 for constraint in constraints):
+            return {k: ty(given[k]) for k, ty in arg_types}
+
+    # Extend the set of explicit constraints with a constraint for each arg
+    # value.
+    extended_constraints = list(constraints) + [arg_symbols[k] - v for k, v in given.items()]
+
+    values = sympy.solve(extended_constraints)
+
+    # sympy sometimes returns a list of solutions, sometimes just a single
+    # dict.
+    if isinstance(values, list):
+        if not len(values):
+            raise NoSolution()
+        values = values[0]
+
+    # Use `ty` to convert each solved value from the sympy type to either
+    # int or float. `values` is indexed by symbol rather than string.
+    return {k: ty(values[arg_symbols[k]]) for k, ty in arg_types}
+
+
+# Constructors are often called repeatedly with the same arguments, e.g. in
+# parameter sweeps. The cache is shared by all wrappers so that functions
+# decorated with the same constraints share solutions too.
+_cached_solve_arguments = functools.lru_cache(maxsize=4096)(_solve_arguments)
+
+
 def make_wrapper(
     func: Callable, constraints: Sequence[Expr], skip_first_arg: bool = False
 ) -> Callable:
@@ -256,51 +841,52 @@ def make_wrapper(
         then call the given func.
     """
     parameters = inspect.signature(func).parameters
-    arg_types = list(
-        (k, int if ty.annotation is int else float) for k, ty in parameters.items()
-    )
+    arg_types = tuple((k, int if ty.annotation is int else float) for k, ty in parameters.items())
     if skip_first_arg:
         arg_types = arg_types[skip_first_arg:]
 
-    # Make a symbol for each arg. We can't use integer=(ty is int) because eg
-    # integer=False excludes real number solutions that happen to be integers.
-    arg_symbols = {
-        k: Symbol(k, integer=True) if ty is int else Symbol(k) for k, ty in arg_types
-    }
+    arg_symbols = _arg_symbols(arg_types)
+    symbol_items = tuple(arg_symbols.items())
+
+    # Collect all the symbols appearing in all constraints
+    constraint_symbols = set(
+        itertools.chain.from_iterable(collect_symbols(constraint) for constraint in constraints)
+    )
+
+    def rewrite_constraints():
+        # Rewrite all constraints so that we use the right symbol, eg
+        # `Symbol('x', integer=True)` rather than `Symbol('x')`. xreplace does
+        # all the replacements in a single exact-match pass over each
+        # constraint.
+        replacements = {
+            sym: arg_symbols[sym.name] for sym in constraint_symbols if sym.name in arg_symbols
+        }
+        return tuple(constraint.xreplace(replacements) for constraint in constraints)
+
+    # The rewritten constraints only change when we see a new keyword, so do
+    # the work up front rather than on every call.
+    rewritten = rewrite_constraints()
 
     @functools.wraps(func)
     def wrapper(*args, **kw):
-        for k, val in kw.items():
-            if k not in arg_symbols:
+        nonlocal rewritten, symbol_items
+        # Comparing key views doesn't allocate anything in the common case
+        # where every keyword is already known.
+        if not kw.keys() <= arg_symbols.keys():
+            for k in kw.keys() - arg_symbols.keys():
                 arg_symbols[k] = Symbol(k)
-
-        # Collect all the symbols appearing in all constraints
-        constraint_symbols = [collect_symbols(constraint) for constraint in constraints]
-        constraint_symbols = set().union(*constraint_symbols)
-
-        # Rewrite all constraints so that we use the right symbol, eg
-        # `Symbol('x', integer=True)` rather than `Symbol('x')`.
-        for i, constraint in enumerate(constraints):
-            for sym in constraint_symbols:
-                if sym.name in arg_symbols:
-                    constraints[i] = constraints[i].subs(sym, arg_symbols[sym.name])
-
-        # Extend the set of explicit constraints with a constraint for each arg
-        # value.
-        extended_constraints = constraints + [arg_symbols[k] - v for k, v in kw.items()]
-
-        values = sympy.solve(extended_constraints)
-
-        # sympy sometimes returns a list of solutions, sometimes just a single
-        # dict.
-        if isinstance(values, list):
-            if not len(values):
-                raise NoSolution()
-            values = values[0]
-
-        # Use `ty` to convert each solved value from the sympy type to either
-        # int or float. `values` is indexed by symbol rather than string.
-        kwargs = {k: ty(values[arg_symbols[k]]) for k, ty in arg_types}
+            rewritten = rewrite_constraints()
+            symbol_items = tuple(arg_symbols.items())
+
+        # The type is part of the key so that eg 1 and 1.0 aren't conflated.
+        assignments = [(k, type(v), v) for k, v in kw.items()]
+        try:
+            key = frozenset(assignments)
+        except TypeError:
+            # Unhashable values, eg numpy arrays, can't be cached.
+            kwargs = _solve_arguments(rewritten, arg_types, symbol_items, assignments)
+        else:
+            kwargs = _cached_solve_arguments(rewritten, arg_types, symbol_items, key)
         return func(*args, **kwargs)
 
     return wrapper
@@ -18,7 +18,7 @@ import math
 import attrs
 import numpy as np
 import pytest
-from sympy import Symbol
+from sympy import exp, Rational, sin, Symbol
 
 import constraintula
 
@@ -61,6 +61,221 @@ def test_constraintula():
     assert np.abs(circle.radius - 10 / (2 * PI)) < 0.001
 
 
+def test_with_independent_reuses_solutions():
+    a, b, ratio, product = constraintula.symbols('a b ratio product')
+    constraints = {a * b - product, a / b - ratio}
+
+    first = constraintula.System(constraints).with_independents([a, b])
+    solve_misses = constraintula.core._solve_for.cache_info().misses
+    misses = constraintula.core._solutions_for.cache_info().misses
+    second = constraintula.System(constraints).with_independents([a, b])
+
+    assert constraintula.core._solve_for.cache_info().misses == solve_misses
+    assert constraintula.core._solutions_for.cache_info().misses == misses
+    assert first.solutions == second.solutions
+
+
+def test_with_independents_solves_coupled_constraints():
+    a, b, total, difference, offset = constraintula.symbols('a b total difference offset')
+    system = constraintula.System(
+        {a + b - total, a - b - difference, offset - 3}
+    ).with_independents([total, difference])
+
+    result = system.evaluate({total: 5, difference: 1})
+    assert math.isclose(result[a], 3)
+    assert math.isclose(result[b], 2)
+    assert math.isclose(result[offset], 3)
+
+
+def test_with_independents_rejects_dependent_symbols():
+    radius, diameter, area = constraintula.symbols('radius diameter area')
+    system = constraintula.System({diameter - 2 * radius, area - PI * radius ** 2})
+    with pytest.raises(ValueError):
+        system.with_independents([radius, diameter])
+
+
+def test_with_independents_underdetermined():
+    a, b, c, d, e, f = constraintula.symbols('a b c d e f')
+    system = constraintula.System({a + b + c - d, a - b - e, b + c - f}).with_independents([a, d])
+
+    assert system.solutions[f] == d - a
+    assert b not in system.solutions
+
+
+def test_system_without_solution():
+    x, y = constraintula.symbols('x y')
+    system = constraintula.System({x - y, x - y - 1})
+    with pytest.raises(constraintula.NoSolution):
+        system.with_independent(y)
+
+
+def test_evaluate_returns_numbers():
+    radius, area = constraintula.symbols('radius area')
+    system = constraintula.System({area - PI * radius ** 2}).with_independent(radius)
+
+    result = system.evaluate({radius: 2.0})
+    assert math.isclose(result[area], 4 * PI)
+    assert isinstance(result[area], float)
+
+
+def test_evaluate_function_without_numpy_equivalent():
+    x, y = constraintula.symbols('x y')
+    system = constraintula.System({y - x * exp(x)}).with_independent(y)
+
+    result = system.evaluate({y: 1.0})
+    assert isinstance(result[x], float)
+    assert math.isclose(result[x], 0.5671432904097838)
+
+
+def test_evaluate_complex_solution():
+    a, b = constraintula.symbols('a b')
+    system = constraintula.System({b ** 2 - a}).with_independent(a)
+
+    result = system.evaluate({a: -4.0})
+    assert isinstance(result[b], complex)
+    assert result[b] == -2j
+
+
+def test_evaluate_zero_divisor():
+    x, y = constraintula.symbols('x y')
+    system = constraintula.System({y * x - 1}).with_independent(x)
+
+    result = system.evaluate({x: 0.0})
+    assert math.isinf(result[y])
+
+
+def test_evaluate_sympy_number():
+    x, y = constraintula.symbols('x y')
+    system = constraintula.System({y * x - 1}).with_independent(x)
+
+    result = system.evaluate({x: Rational(1, 3)})
+    assert math.isclose(result[y], 3)
+
+
+def test_evaluate_batch():
+    radius, diameter, area = constraintula.symbols('radius diameter area')
+    system = constraintula.System(
+        {diameter - 2 * radius, area - PI * radius ** 2}
+    ).with_independent(radius)
+
+    radii = np.array([1.0, 2.0, 3.0])
+    result = system.evaluate_batch({radius: radii})
+    assert not np.shares_memory(result[radius], radii)
+    np.testing.assert_allclose(result[radius], radii)
+    np.testing.assert_allclose(result[diameter], 2 * radii)
+    np.testing.assert_allclose(result[area], PI * radii ** 2)
+
+
+def test_evaluate_batch_function_without_numpy_equivalent():
+    x, y = constraintula.symbols('x y')
+    system = constraintula.System({y - x * exp(x)}).with_independent(y)
+
+    result = system.evaluate_batch({y: np.array([0.0, 1.0])})
+    np.testing.assert_allclose(result[x], [0, 0.5671432904097838])
+
+
+def test_evaluate_batch_complex_solution():
+    a, b = constraintula.symbols('a b')
+    system = constraintula.System({b ** 2 - a}).with_independent(a)
+
+    result = system.evaluate_batch({a: np.array([4.0, -4.0])})
+    np.testing.assert_allclose(result[b], [-2, -2j])
+
+
+def test_evaluate_without_closed_form():
+    pytest.importorskip('scipy')
+    x, y, z = constraintula.symbols('x y z')
+    system = constraintula.System({y - x - sin(x), z - 2 * x}).with_independent(y)
+    assert x not in system.solutions
+
+    result = system.evaluate({y: 1.5})
+    assert math.isclose(result[x] + math.sin(result[x]), 1.5)
+    assert math.isclose(result[z], 2 * result[x])
+
+    result = system.evaluate({y: 1e8})
+    assert math.isclose(result[x] + math.sin(result[x]), 1e8)
+
+
+def test_evaluate_without_closed_form_needs_scipy(monkeypatch):
+    x, y = constraintula.symbols('x y')
+    system = constraintula.System({y - x - sin(x)}).with_independent(y)
+    monkeypatch.setattr(constraintula.core, '_optional_import', lambda name: None)
+
+    with pytest.raises(ImportError, match='scipy'):
+        system.evaluate({y: 1.5})
+
+
+def test_evaluate_underdetermined():
+    diameter, radius, circumference = constraintula.symbols('diameter radius circumference')
+    system = constraintula.System(
+        {diameter - 2 * radius, circumference - PI * diameter, circumference - 2 * PI * radius}
+    )
+    with pytest.raises(ValueError):
+        system.evaluate({})
+
+    x, y = constraintula.symbols('x y')
+    with pytest.raises(ValueError):
+        constraintula.System({x - y, 2 * x - 2 * y}).evaluate({})
+
+
+@pytest.fixture
+def symengine_functions(monkeypatch):
+    """Compile expressions of any size with symengine.
+
+    Yields a list of the functions symengine compiles.
+    """
+    pytest.importorskip('symengine')
+    core = constraintula.core
+    original = core._symengine_lambdify
+    functions = []
+
+    def symengine_lambdify(expressions, args):
+        function = original(expressions, args)
+        functions.append(function)
+        return function
+
+    monkeypatch.setattr(core, '_SYMENGINE_MIN_OPS', 0)
+    monkeypatch.setattr(core, '_symengine_lambdify', symengine_lambdify)
+    # Don't reuse, or leave behind, functions compiled under other settings.
+    core._compile_solutions.cache_clear()
+    core._compile_function.cache_clear()
+    yield functions
+    core._compile_solutions.cache_clear()
+    core._compile_function.cache_clear()
+
+
+def test_evaluate_with_symengine(symengine_functions):
+    side, diagonal, perimeter = constraintula.symbols('side diagonal perimeter')
+    system = constraintula.System(
+        {diagonal ** 2 - 2 * side ** 2, perimeter - 4 * side}
+    ).with_independent(perimeter)
+
+    result = system.evaluate({perimeter: 8.0})
+    assert symengine_functions and None not in symengine_functions
+    assert math.isclose(result[side], 2)
+    assert math.isclose(abs(result[diagonal]), 2 * math.sqrt(2))
+
+
+def test_get_functions_with_symengine(symengine_functions):
+    width, height, area = constraintula.symbols('width height area')
+    system = constraintula.System({area - width * height}).with_independents([width, height])
+
+    area_function = system.get_functions()[area]
+    assert symengine_functions and None not in symengine_functions
+    assert math.isclose(area_function(2.0, 3.0), 6)
+    np.testing.assert_allclose(area_function(np.array([1.0, 2.0]), 3.0), [3, 6])
+
+
+def test_get_functions_jit():
+    pytest.importorskip('numba')
+    radius, area = constraintula.symbols('radius area')
+    system = constraintula.System({area - PI * radius ** 2}).with_independent(radius)
+
+    area_function = system.get_functions(jit=True)[area]
+    assert math.isclose(area_function(2.0), 4 * PI)
+    np.testing.assert_allclose(area_function(np.array([1.0, 2.0])), [PI, 4 * PI])
+
+
 def test_make_wrapper():
     x, y, z = constraintula.symbols('x y z')
     foo_factory = constraintula.make_wrapper(Foo, [x - y * z])
@@ -68,6 +283,43 @@ def test_make_wrapper():
     assert math.isclose(foo.x, 6)
 
 
+def test_make_wrapper_repeated_calls():
+    x, y, z = constraintula.symbols('x y z')
+    calls = []
+
+    def record(x, y, z):
+        calls.append((x, y, z))
+
+    wrapper = constraintula.make_wrapper(record, [x - y * z])
+    wrapper(y=2, z=3)
+    wrapper(y=2, z=3)
+    wrapper(z=3, y=2.0)
+    assert calls == [(6, 2, 3)] * 3
+
+
+def test_make_wrapper_all_args_given():
+    x, y, z = constraintula.symbols('x y z')
+    foo_factory = constraintula.make_wrapper(Foo, [x - y * z])
+
+    foo = foo_factory(x=6, y=2, z=3)
+    assert (foo.x, foo.y, foo.z) == (6, 2, 3)
+    assert isinstance(foo.x, float)
+    with pytest.raises(constraintula.NoSolution):
+        foo_factory(x=7, y=2, z=3)
+
+
+def test_make_wrapper_shares_solutions_between_wrappers():
+    x, y, z = constraintula.symbols('x y z')
+    first = constraintula.make_wrapper(Foo, [x - y * z])
+    second = constraintula.make_wrapper(Foo, [x - y * z])
+
+    first(x=8, y=2)
+    misses = constraintula.core._cached_solve_arguments.cache_info().misses
+    foo = second(x=8, y=2)
+    assert constraintula.core._cached_solve_arguments.cache_info().misses == misses
+    assert math.isclose(foo.z, 4)
+
+
 def test_circle():
     circumference, diameter, radius, area = \
         constraintula.symbols('circumference diameter radius area')
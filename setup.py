@@ -58,6 +58,15 @@ setuptools.setup(
             'attrs',
             'pytest',
         ],
+        'jit': [
+            'numba',
+        ],
+        'numeric': [
+            'scipy',
+        ],
+        'symengine': [
+            'symengine',
+        ],
     },
     classifiers=[
         "Programming Language :: Python :: 3",